@@ -1,28 +1,41 @@
-from fastapi import FastAPI, HTTPException, Request, Header
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request, Header, Depends
+from fastapi.responses import PlainTextResponse, Response
 import uvicorn
 from datetime import datetime
 import sys
 import os
 import json
 import logging
-from typing import Dict, Any, Callable, Awaitable
+from typing import Dict, Any, Callable, Awaitable, Optional, Set, Tuple
 import httpx
+import asyncio
+import hmac
+import threading
 from contextlib import asynccontextmanager
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.intent_analyzer import SimpleIntentAnalyzer
+from services.conversation_context import ConversationContextStore
 from services.smax_service import SmaxService
 from services.webhook_service import WebhookService
 from utils.response_formatter import ResponseFormatter
-from config import SMAX_API_KEY
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.bulkhead import Bulkhead, BulkheadFull
+from utils.profiling import SamplingProfiler, SlowRequestTracer
+from utils.json_response import FastJSONResponse, prebuilt_json_response
+from config import SMAX_API_KEY, INTENT_PATTERNS_FILE, INTENT_PATTERNS_RELOAD_INTERVAL, WEBHOOK_DEADLINE_SECONDS, BACKGROUND_SHUTDOWN_TIMEOUT, INTENT_BULKHEADS
+from config import ADMIN_TOKEN, PROFILE_MAX_SECONDS, SLOW_REQUEST_THRESHOLD_MS, SLOW_REQUEST_BUFFER_SIZE
+from config import CONVERSATION_CONTEXT_TTL, CONVERSATION_CONTEXT_MAX_ENTRIES, CONVERSATION_CONTEXT_DB, CONVERSATION_CONTEXT_FLUSH_INTERVAL
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
 # reusable http client that will be initialized on startup
 http_client = None
 
+# strong references to work that outlived its request deadline
+background_tasks: Set[asyncio.Task] = set()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -35,12 +48,34 @@ async def lifespan(app: FastAPI):
     
     # Pass the client to services that need it
     webhook_service.set_http_client(http_client)
+
+    # watch the intent pattern file so new phrasings go live without a restart
+    patterns_watcher = asyncio.create_task(intent_analyzer.watch_patterns(INTENT_PATTERNS_RELOAD_INTERVAL))
+    # batch conversation context writes to SQLite off the request path
+    context_flusher = asyncio.create_task(conversation_context.flush_periodically(CONVERSATION_CONTEXT_FLUSH_INTERVAL))
     
     yield
     
     logging.info("👋 Shutting down application...")
+    patterns_watcher.cancel()
+    context_flusher.cancel()
+    for task, result in zip(
+        (patterns_watcher, context_flusher),
+        await asyncio.gather(patterns_watcher, context_flusher, return_exceptions=True),
+    ):
+        if isinstance(result, Exception):
+            logging.error(f"Background task {task.get_coro().__qualname__} failed: {result!r}", exc_info=result)
+    if background_tasks:
+        logging.info(f"Waiting for {len(background_tasks)} background task(s) to finish...")
+        _, pending = await asyncio.wait(set(background_tasks), timeout=BACKGROUND_SHUTDOWN_TIMEOUT)
+        if pending:
+            logging.warning(f"Cancelling {len(pending)} background task(s) still running after {BACKGROUND_SHUTDOWN_TIMEOUT}s")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
     if http_client:
         await http_client.aclose()
+    conversation_context.close()
 
 app = FastAPI(title="Zalo Bot", version="1.0.0", lifespan=lifespan)
 
@@ -68,33 +103,86 @@ async def log_all_requests(request: Request, call_next):
     logging.info(f"🌍 Response: {response.status_code} ({duration:.3f}s)")
     return response
 
-intent_analyzer = SimpleIntentAnalyzer()
+conversation_context = ConversationContextStore(
+    ttl=CONVERSATION_CONTEXT_TTL,
+    max_entries=CONVERSATION_CONTEXT_MAX_ENTRIES,
+    sqlite_path=CONVERSATION_CONTEXT_DB,
+)
+intent_analyzer = SimpleIntentAnalyzer(INTENT_PATTERNS_FILE, conversation_context)
 smax_service = SmaxService()
 webhook_service = WebhookService()
 response_formatter = ResponseFormatter()
 
+profiler = SamplingProfiler()
+slow_request_tracer = SlowRequestTracer(SLOW_REQUEST_THRESHOLD_MS, SLOW_REQUEST_BUFFER_SIZE)
+
+# rendered once, returned when a request runs out of its deadline budget
+PROCESSING_REPLY = response_formatter.format_processing()
+
+# constant webhook responses, serialized once at startup
+EMPTY_BODY_RESPONSE = prebuilt_json_response(200, {"message": "Webhook received, empty body."})
+TEST_PAYLOAD_RESPONSE = prebuilt_json_response(200, {"success": True, "message": "Bot test successful."})
+MISSING_MESSAGE_RESPONSE = prebuilt_json_response(400, {"error": "Missing message text."})
+EMPTY_COMMAND_RESPONSE = prebuilt_json_response(400, {"error": "Empty command after cleaning."})
+INTERNAL_ERROR_RESPONSE = prebuilt_json_response(500, {"success": False, "error": "An internal server error occurred."})
+
+# "period" from the analyzer (e.g. "tuần trước") selects the previous report of the same kind
+PREVIOUS_PERIODS = {"today": "yesterday", "week": "last_week", "month": "last_month"}
+
+def call_report_period(base: str, params: Dict[str, Any]) -> str:
+    """Returns the report period to fetch: the previous one if the params ask for it."""
+    previous = PREVIOUS_PERIODS[base]
+    return previous if params.get("period") == previous else base
+
 INTENT_HANDLERS: Dict[str, Callable[..., Awaitable[Dict[str, Any]]]] = {
-    "call_report_today": lambda params: smax_service.get_call_report("today"),
-    "call_report_week": lambda params: smax_service.get_call_report("week"),
-    "call_report_month": lambda params: smax_service.get_call_report("month"),
+    "call_report_today": lambda params: smax_service.get_call_report(call_report_period("today", params)),
+    "call_report_week": lambda params: smax_service.get_call_report(call_report_period("week", params)),
+    "call_report_month": lambda params: smax_service.get_call_report(call_report_period("month", params)),
     "system_status": lambda params: smax_service.get_system_status(),
     "phone_list": lambda params: smax_service.get_phone_config(),
     "phone_config": lambda params: smax_service.configure_phone(params.get("phone_number")),
 }
 
+# one bulkhead per handler so a flood of one intent cannot starve the others
+BULKHEADS: Dict[str, Bulkhead] = {
+    intent: Bulkhead(intent, *INTENT_BULKHEADS.get(intent, (10, 50)))
+    for intent in INTENT_HANDLERS
+}
+
 FORMATTER_MAPPING: Dict[str, Callable[..., str]] = {
-    "call_report_today": lambda data: response_formatter.format_call_report(data, "today"),
-    "call_report_week": lambda data: response_formatter.format_call_report(data, "week"),
-    "call_report_month": lambda data: response_formatter.format_call_report(data, "month"),
-    "system_status": response_formatter.format_system_status,
-    "phone_list": response_formatter.format_phone_config,
-    "phone_config": response_formatter.format_config_result,
+    "call_report_today": lambda data, params: response_formatter.format_call_report(data, call_report_period("today", params)),
+    "call_report_week": lambda data, params: response_formatter.format_call_report(data, call_report_period("week", params)),
+    "call_report_month": lambda data, params: response_formatter.format_call_report(data, call_report_period("month", params)),
+    "system_status": lambda data, params: response_formatter.format_system_status(data),
+    "phone_list": lambda data, params: response_formatter.format_phone_config(data),
+    "phone_config": lambda data, params: response_formatter.format_config_result(data),
 }
 
-async def handle_intent(intent_result: dict) -> str:
+def format_intent_data(intent: str, data: Dict[str, Any], params: Dict[str, Any]) -> str:
+    """Formats the handler result for an intent into the reply text."""
+    formatter = FORMATTER_MAPPING.get(intent)
+    if not formatter:
+        logging.error(f"No formatter found for intent: {intent}")
+        return response_formatter.format_unknown_command()
+
+    return formatter(data, params)
+
+async def run_in_bulkhead(bulkhead: Bulkhead, handler: Callable[..., Awaitable[Dict[str, Any]]], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs a handler on an already acquired bulkhead slot and releases it when done."""
+    try:
+        return await handler(params)
+    finally:
+        bulkhead.release()
+
+async def handle_intent(intent_result: dict, deadline: Optional[Deadline] = None) -> str:
     """
     Handles business logic based on the analyzed intent.
     Uses mappings to call the correct service method and format the response.
+    If a deadline is given, the handler only gets the remaining budget and
+    DeadlineExceeded is raised (with the still-running handler) when it runs out.
+    Handlers run inside their intent's bulkhead. Admission happens before the
+    handler starts: a full queue, or a deadline that passes while queued, gets
+    a busy reply instead of leaving a waiter behind.
     """ 
     intent = intent_result.get("intent")
     params = intent_result.get("parameters", {})
@@ -108,14 +196,42 @@ async def handle_intent(intent_result: dict) -> str:
         logging.warning(f"No handler found for intent: {intent}")
         return response_formatter.format_unknown_command()
 
-    data = await handler(params)
-    
-    formatter = FORMATTER_MAPPING.get(intent)
-    if not formatter:
-        logging.error(f"No formatter found for intent: {intent}")
-        return response_formatter.format_unknown_command()
-
-    return formatter(data)
+    bulkhead = BULKHEADS[intent]
+    try:
+        queue_wait = await bulkhead.acquire(timeout=deadline.remaining() if deadline is not None else None)
+    except BulkheadFull as e:
+        logging.warning(f"{e}, rejecting request. Stats: {bulkhead.stats()}")
+        return response_formatter.format_busy()
+    if queue_wait > 0.1:
+        logging.info(f"Intent '{intent}' waited {queue_wait:.3f}s for a bulkhead slot")
+
+    if deadline is not None:
+        data = await deadline.run(run_in_bulkhead(bulkhead, handler, params), stage=f"intent:{intent}")
+    else:
+        data = await run_in_bulkhead(bulkhead, handler, params)
+
+    return format_intent_data(intent, data, params)
+
+def run_in_background(coro: Awaitable[Any]) -> None:
+    """Schedules a coroutine that must keep running after the request returns."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def finish_after_deadline(exc: DeadlineExceeded, intent_result: Dict[str, Any], body: Dict[str, Any], headers: Dict[str, str]):
+    """
+    Completes a webhook whose deadline expired. If the intent handler was still
+    running, its result is formatted and sent to SMAX; if the SMAX send was
+    still running, we just wait for it to settle.
+    """
+    try:
+        result = await exc.pending
+        if exc.stage.startswith("intent:"):
+            response_text = format_intent_data(intent_result.get("intent"), result, intent_result.get("parameters", {}))
+            result = await webhook_service.send_response_to_smax(response_text, body, headers)
+        logging.info(f"Background completion after '{exc.stage}': SMAX send {'Success' if result else 'Failure'}")
+    except Exception as e:
+        logging.error(f"Background completion after '{exc.stage}' failed: {e}", exc_info=True)
 
 async def parse_request_body(request: Request) -> Dict[str, Any]:
     """Parses and logs the request body, handling potential errors."""
@@ -153,6 +269,15 @@ def get_message_text(body: Dict[str, Any], headers: Dict[str, str] = None) -> st
     result = message_text.strip() if message_text else ""
     return result
 
+def get_conversation_key(body: Dict[str, Any], headers: Dict[str, str]) -> Optional[Tuple[str, str, str]]:
+    """Builds the (page_pid, group_id, user_id) key for conversation context, or None if unusable."""
+    page_pid = str(headers.get("page_pid") or body.get("page_pid") or "")
+    group_id = str(headers.get("group_id") or body.get("group_id") or "")
+    user_id = str(headers.get("user_id") or body.get("user_id") or "")
+    if not page_pid or not user_id or "{{" in page_pid + group_id + user_id:
+        return None
+    return (page_pid, group_id, user_id)
+
 def is_smax_test_payload(body: Dict[str, Any]) -> bool:
     """Checks if the payload is a test request from SMAX."""
     smax_template_patterns = ["{{$.user id}}", "{{$.group id}}", "{{$."]
@@ -168,7 +293,12 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "intent_pattern_version": intent_analyzer.pattern_version,
+        "bulkheads": {intent: bulkhead.stats() for intent, bulkhead in BULKHEADS.items()}
+    }
 
 @app.get("/webhook/zalo-biva", status_code=200)
 async def verify_smax_webhook():
@@ -180,9 +310,57 @@ async def verify_smax_webhook():
     logging.info("Received GET request for Zalo-Biva webhook verification. Responding with success to confirm endpoint validity.")
     return {"status": "verification_successful"}
 
+def require_admin(x_admin_token: str = Header(None)):
+    """Guards admin endpoints; they don't exist unless ADMIN_TOKEN is configured."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Unauthorized: Invalid admin token")
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def capture_profile(seconds: float = 10.0):
+    """
+    Samples the event loop thread for `seconds` and returns the collapsed stacks,
+    which can be opened directly in speedscope or fed to flamegraph.pl.
+    """
+    if seconds <= 0 or seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}]")
+    try:
+        session = profiler.start(threading.get_ident(), seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    logging.info(f"Profiling event loop for {seconds}s...")
+    await asyncio.to_thread(session.join)
+    filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed.txt"
+    return PlainTextResponse(
+        session.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def list_slow_requests():
+    """Returns the most recent webhooks slower than SLOW_REQUEST_THRESHOLD_MS."""
+    return {
+        "enabled": slow_request_tracer.enabled,
+        "threshold_ms": SLOW_REQUEST_THRESHOLD_MS,
+        "requests": list(slow_request_tracer.records)
+    }
+
 @app.post("/webhook/zalo-biva")
 async def handle_smax_webhook(request: Request, x_api_key: str = Header(None)):
     """Main endpoint to receive and process messages from Zalo via SMAX."""
+    trace = slow_request_tracer.begin("handle_smax_webhook")
+    try:
+        return await process_smax_webhook(request, x_api_key, trace)
+    finally:
+        record = slow_request_tracer.finish(trace)
+        if record:
+            logging.warning(f"Slow webhook ({record['total_ms']}ms): {record['stages']}")
+
+async def process_smax_webhook(request: Request, x_api_key: str, trace) -> Response:
+    """Processes one SMAX webhook, timing each stage on `trace`."""
+    deadline = Deadline(WEBHOOK_DEADLINE_SECONDS)
     logging.info("========== ZALO-BIVA WEBHOOK REQUEST RECEIVED ==========")
     logging.info(f"Request headers: {dict(request.headers)}")
     logging.info(f"Request method: {request.method}")
@@ -197,20 +375,21 @@ async def handle_smax_webhook(request: Request, x_api_key: str = Header(None)):
         # raise HTTPException(status_code=401, detail="Unauthorized: Invalid API Key")
 
     try:
-        body = await parse_request_body(request)
+        with trace.stage("parse_body"):
+            body = await parse_request_body(request)
         if not body:
-            return JSONResponse(status_code=200, content={"message": "Webhook received, empty body."})
+            return EMPTY_BODY_RESPONSE()
 
         message_text = get_message_text(body, dict(request.headers))
         
         if not message_text and is_smax_test_payload(body):
             logging.info("Test payload from SMAX received. Responding with success.")
-            return JSONResponse(status_code=200, content={"success": True, "message": "Bot test successful."})
+            return TEST_PAYLOAD_RESPONSE()
 
         if not message_text:
             logging.error("No valid message text found in payload.")
             logging.error(f"Full payload received: {json.dumps(body, ensure_ascii=False, indent=2)}")
-            return JSONResponse(status_code=400, content={"error": "Missing message text."})
+            return MISSING_MESSAGE_RESPONSE()
 
         original_message = message_text # Store original message for logging
         logging.info(f"Original message received: '{original_message}'")
@@ -233,15 +412,41 @@ async def handle_smax_webhook(request: Request, x_api_key: str = Header(None)):
 
         if not message_text:
             logging.error("Command is empty after cleaning.")
-            return JSONResponse(status_code=400, content={"error": "Empty command after cleaning."})
+            return EMPTY_COMMAND_RESPONSE()
 
-        intent_result = intent_analyzer.analyze(message_text)
+        headers = dict(request.headers)
+        with trace.stage("analyze_intent"):
+            intent_result = intent_analyzer.analyze(message_text, get_conversation_key(body, headers))
         logging.info(f"Intent analysis result: {intent_result}")
 
-        response_text = await handle_intent(intent_result)
+        response_text = None
+        try:
+            with trace.stage("handle_intent"):
+                response_text = await handle_intent(intent_result, deadline)
+
+            logging.info(f"Sending response back to SMAX ({deadline.remaining():.3f}s budget left)...")
+            with trace.stage("smax_send"):
+                smax_send_result = await deadline.run(
+                    webhook_service.send_response_to_smax(response_text, body, headers),
+                    stage="smax_send",
+                )
+        except DeadlineExceeded as exc:
+            logging.warning(f"Webhook deadline of {deadline.budget}s exceeded during '{exc.stage}'. Finishing asynchronously.")
+            run_in_background(finish_after_deadline(exc, intent_result, body, headers))
+            # once the reply is rendered (incl. the busy reply), return exactly what is being sent to SMAX
+            return FastJSONResponse(status_code=200, content={
+                "success": True,
+                "message": response_text if response_text is not None else PROCESSING_REPLY,
+                "smax_forward_status": "pending",
+                "metadata": {
+                    "intent": intent_result.get("intent"),
+                    "confidence": intent_result.get("confidence"),
+                    "pattern_version": intent_result.get("pattern_version"),
+                    "deadline_stage": exc.stage,
+                    "processed_at": datetime.now().isoformat()
+                }
+            })
 
-        logging.info("Sending response back to SMAX...")
-        smax_send_result = await webhook_service.send_response_to_smax(response_text, body, dict(request.headers))
         logging.info(f"SMAX send result: {'Success' if smax_send_result else 'Failure'}")
         
         response_payload = {
@@ -251,21 +456,19 @@ async def handle_smax_webhook(request: Request, x_api_key: str = Header(None)):
             "metadata": {
                 "intent": intent_result.get("intent"),
                 "confidence": intent_result.get("confidence"),
+                "pattern_version": intent_result.get("pattern_version"),
                 # "bot_id": BOT_ID
                 "processed_at": datetime.now().isoformat()
             }
         }
-        return JSONResponse(status_code=200, content=response_payload)
+        return FastJSONResponse(status_code=200, content=response_payload)
 
     except HTTPException as http_exc:
         # Re-raise HTTPException to let FastAPI handle it
         raise http_exc
     except Exception as e:
         logging.error(f"An unexpected error occurred while processing the webhook: {e}", exc_info=True)
-        return JSONResponse(
-            status_code=500,
-            content={"success": False, "error": "An internal server error occurred."}
-        )
+        return INTERNAL_ERROR_RESPONSE()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8888)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Benchmark for the webhook response layer.
+
+Compares building each response shape returned by /webhook/zalo-biva with the
+stock JSONResponse against the pre-serialized / fast-encoder path, and checks
+that both produce byte-identical bodies. Values the fast encoder is known to
+render differently (NaN, inf, large floats) are reported separately.
+
+Usage: python benchmarks/bench_responses.py [iterations]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+
+from utils.json_response import FastJSONResponse, _stdlib_dumps, dumps, orjson, prebuilt_json_response
+from utils.response_formatter import ResponseFormatter
+
+def dynamic_payload(message: str, status: str, **metadata):
+    return {
+        "success": True,
+        "message": message,
+        "smax_forward_status": status,
+        "metadata": {
+            "intent": "call_report_week",
+            "confidence": 0.95,
+            "pattern_version": "c3f40efba4d1",
+            **metadata,
+            "processed_at": datetime.now().isoformat()
+        }
+    }
+
+CONSTANT_SHAPES = {
+    "empty_body": (200, {"message": "Webhook received, empty body."}),
+    "test_payload": (200, {"success": True, "message": "Bot test successful."}),
+    "missing_message": (400, {"error": "Missing message text."}),
+    "empty_command": (400, {"error": "Empty command after cleaning."}),
+    "internal_error": (500, {"success": False, "error": "An internal server error occurred."}),
+}
+
+DYNAMIC_SHAPES = {
+    "success": (200, dynamic_payload(ResponseFormatter.format_call_report({
+        "total_calls": 210,
+        "successful_calls": 180,
+        "failed_calls": 30,
+        "daily_breakdown": [{"date": f"{i:02d}/10", "calls": 30 - i} for i in range(7)]
+    }, "week"), "sent")),
+    "deadline_processing": (200, dynamic_payload(ResponseFormatter.format_processing(), "pending", deadline_stage="smax_send")),
+}
+
+# values where orjson is known to differ from the stdlib encoder; reported, not timed
+EDGE_CASES = {
+    "nan": {"confidence": float("nan")},
+    "infinity": {"confidence": float("inf")},
+    "large_float": {"confidence": 1e20},
+}
+
+def check_edge_cases():
+    """Reports whether the fast encoder still matches stdlib output for known edge values."""
+    print(f"{'edge case':<22}{'stdlib':>24}{'fast':>24}  match")
+    for name, content in EDGE_CASES.items():
+        outputs = []
+        for encode in (_stdlib_dumps, dumps):
+            try:
+                outputs.append(encode(content).decode("utf-8"))
+            except ValueError as e:
+                outputs.append(f"<{type(e).__name__}>")
+        print(f"{name:<22}{outputs[0]:>24}{outputs[1]:>24}  {'yes' if outputs[0] == outputs[1] else 'NO'}")
+
+def bench(name, baseline, candidate, iterations):
+    assert baseline().body == candidate().body, f"{name}: bodies differ"
+    base = timeit.timeit(baseline, number=iterations) / iterations * 1e6
+    fast = timeit.timeit(candidate, number=iterations) / iterations * 1e6
+    print(f"{name:<22}{base:>12.2f}{fast:>12.2f}{base / fast:>9.2f}x")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib json'}, iterations: {iterations}")
+    print(f"{'shape':<22}{'stdlib us':>12}{'fast us':>12}{'speedup':>10}")
+
+    for name, (status, content) in CONSTANT_SHAPES.items():
+        prebuilt = prebuilt_json_response(status, content)
+        bench(name, lambda: JSONResponse(status_code=status, content=content), prebuilt, iterations)
+
+    for name, (status, content) in DYNAMIC_SHAPES.items():
+        bench(
+            name,
+            lambda: JSONResponse(status_code=status, content=content),
+            lambda: FastJSONResponse(status_code=status, content=content),
+            iterations,
+        )
+
+    print()
+    check_edge_cases()
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +12,45 @@ SMAX_API_KEY = os.getenv("SMAX_API_KEY", "your_default_smax_api_key_here")
 SMAX_RESPONSE_WEBHOOK_URL = os.getenv("SMAX_RESPONSE_WEBHOOK_URL")
 DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "t")
 
+INTENT_PATTERNS_FILE = os.getenv(
+    "INTENT_PATTERNS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "services", "intent_patterns.json"),
+)
+INTENT_PATTERNS_RELOAD_INTERVAL = float(os.getenv("INTENT_PATTERNS_RELOAD_INTERVAL", "5"))
+
+# end-to-end budget (seconds) for one webhook; SMAX gives up before the 10s http client timeout
+WEBHOOK_DEADLINE_SECONDS = float(os.getenv("WEBHOOK_DEADLINE_SECONDS", "4"))
+# how long shutdown waits for work that outlived its deadline before cancelling it
+BACKGROUND_SHUTDOWN_TIMEOUT = float(os.getenv("BACKGROUND_SHUTDOWN_TIMEOUT", "10"))
+
+# per-intent bulkheads: (max in-flight, max queued). There is no scheduler-level
+# priority; cheap intents are favoured only by giving them wider limits, so expensive
+# ones are rejected first. Override with INTENT_BULKHEADS='{"phone_config": [4, 10]}'
+INTENT_BULKHEADS = {
+    "system_status": (20, 100),
+    "call_report_today": (10, 50),
+    "call_report_week": (10, 50),
+    "call_report_month": (10, 50),
+    "phone_list": (10, 50),
+    "phone_config": (2, 5),
+}
+INTENT_BULKHEADS.update({k: tuple(v) for k, v in json.loads(os.getenv("INTENT_BULKHEADS", "{}")).items()})
+
+# admin/profiling endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# webhooks slower than this are recorded with a per-stage breakdown (0 = disabled)
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "0"))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "100"))
+
+# last intent per (page_pid, group_id, user_id), used to resolve follow-up questions
+CONVERSATION_CONTEXT_TTL = float(os.getenv("CONVERSATION_CONTEXT_TTL", "900"))
+CONVERSATION_CONTEXT_MAX_ENTRIES = int(os.getenv("CONVERSATION_CONTEXT_MAX_ENTRIES", "10000"))
+# optional local SQLite file so context survives restarts (unset = memory only)
+CONVERSATION_CONTEXT_DB = os.getenv("CONVERSATION_CONTEXT_DB")
+# how often changed context entries are written to that file, off the event loop
+CONVERSATION_CONTEXT_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_CONTEXT_FLUSH_INTERVAL", "5"))
+
 if not all([SMAX_API_KEY, SMAX_TOKEN, SMAX_RESPONSE_WEBHOOK_URL]):
     print("CRITICAL ERROR: One or more required environment variables are missing.")
     print("Please check your .env file and ensure the following are set:")
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ConversationKey = Tuple[str, str, str]
+
+class ContextEntry:
+    """intent và parameters gần nhất của một cuộc hội thoại"""
+
+    __slots__ = ("intent", "parameters", "updated_at")
+
+    def __init__(self, intent: str, parameters: Dict[str, Any], updated_at: Optional[float] = None):
+        self.intent = intent
+        self.parameters = parameters
+        self.updated_at = updated_at if updated_at is not None else time.time()
+
+class ConversationContextStore:
+    """
+    Lưu context theo (page_pid, group_id, user_id) với LRU + TTL và giới hạn
+    cứng số entry. Nếu có `sqlite_path`, context được nạp từ SQLite một lần lúc
+    khởi động, và các entry thay đổi được ghi xuống theo lô trong thread riêng
+    (flush_periodically) để còn dùng được sau khi restart. Hot path
+    (get/put) không bao giờ chạm tới đĩa.
+    """
+
+    # parameters lớn hơn mức này không được lưu, để giữ bộ nhớ mỗi entry nhỏ
+    MAX_PARAMETERS_BYTES = 1024
+
+    def __init__(self, ttl: float = 900, max_entries: int = 10000, sqlite_path: Optional[str] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[ConversationKey, ContextEntry]" = OrderedDict()
+        # entry đã thay đổi nhưng chưa ghi xuống SQLite
+        self._dirty: Dict[ConversationKey, ContextEntry] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS conversation_context ("
+                    "page_pid TEXT, group_id TEXT, user_id TEXT, intent TEXT, parameters TEXT, updated_at REAL, "
+                    "PRIMARY KEY (page_pid, group_id, user_id))"
+                )
+                self._db.execute("DELETE FROM conversation_context WHERE updated_at < ?", (time.time() - self.ttl,))
+                self._db.commit()
+                self._load_all()
+                logger.info(f"Conversation context spill enabled at '{sqlite_path}', {len(self._entries)} entries loaded")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open conversation context database '{sqlite_path}': {e}. Spill disabled.")
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, entry: ContextEntry) -> bool:
+        return time.time() - entry.updated_at > self.ttl
+
+    def get(self, key: ConversationKey) -> Optional[ContextEntry]:
+        """lấy context còn hạn của cuộc hội thoại"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if self._expired(entry):
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: ConversationKey, intent: str, parameters: Dict[str, Any]):
+        """ghi lại intent vừa xử lý của cuộc hội thoại"""
+        if len(json.dumps(parameters, ensure_ascii=False).encode("utf-8")) > self.MAX_PARAMETERS_BYTES:
+            logger.warning(f"Parameters for intent '{intent}' are too large to keep as context. Skipping.")
+            return
+        entry = ContextEntry(intent, dict(parameters))
+        self._insert(key, entry)
+        if self._db is not None:
+            self._dirty[key] = entry
+
+    def _insert(self, key: ConversationKey, entry: ContextEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_all(self):
+        """nạp các entry mới nhất còn hạn, cũ trước mới sau để giữ đúng thứ tự LRU"""
+        rows = self._db.execute(
+            "SELECT page_pid, group_id, user_id, intent, parameters, updated_at FROM conversation_context "
+            "WHERE updated_at >= ? ORDER BY updated_at DESC LIMIT ?",
+            (time.time() - self.ttl, self.max_entries),
+        ).fetchall()
+        for page_pid, group_id, user_id, intent, parameters, updated_at in reversed(rows):
+            self._insert((page_pid, group_id, user_id), ContextEntry(intent, json.loads(parameters), updated_at))
+
+    def _write(self, items: List[Tuple[ConversationKey, ContextEntry]]):
+        """ghi một lô entry xuống SQLite; chạy ngoài event loop"""
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO conversation_context VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (*key, entry.intent, json.dumps(entry.parameters, ensure_ascii=False), entry.updated_at)
+                        for key, entry in items
+                    ],
+                )
+                self._db.execute("DELETE FROM conversation_context WHERE updated_at < ?", (time.time() - self.ttl,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to spill conversation context: {e}")
+
+    def _take_dirty(self) -> List[Tuple[ConversationKey, ContextEntry]]:
+        items, self._dirty = list(self._dirty.items()), {}
+        return items
+
+    async def flush(self):
+        """ghi các entry đã thay đổi xuống SQLite trong worker thread"""
+        if self._db is None or not self._dirty:
+            return
+        await asyncio.to_thread(self._write, self._take_dirty())
+
+    async def flush_periodically(self, interval: float = 5.0):
+        if self._db is None:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def close(self):
+        """ghi nốt các entry chưa flush rồi đóng kết nối (gọi lúc shutdown)"""
+        if self._db is None:
+            return
+        self._write(self._take_dirty())
+        with self._db_lock:
+            self._db.close()
+            self._db = None
\ No newline at end of file
@@ -30,6 +30,25 @@ class FakeDataService:
                 "total_calls": 900,
                 "growth_rate": "+15%",
                 "busiest_hour": "10:00"
+            },
+            "yesterday": {
+                "total_calls": 38,
+                "successful_calls": 33,
+                "failed_calls": 5,
+                "avg_duration": "115 giây"
+            },
+            "last_week": {
+                "total_calls": 195,
+                "successful_calls": 170,
+                "failed_calls": 25,
+                "daily_breakdown": [
+                    {"date": (today - timedelta(days=i)).strftime("%d/%m"), "calls": 28 - i} for i in range(7, 14)
+                ]
+            },
+            "last_month": {
+                "total_calls": 780,
+                "growth_rate": "+8%",
+                "busiest_hour": "14:00"
             }
         }
     
@@ -1,77 +1,215 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Pattern, Tuple
+
+from .conversation_context import ConversationContextStore, ConversationKey
+
+logger = logging.getLogger(__name__)
+
+# dấu hiệu của câu hỏi nối tiếp, vd. "tuần trước thì sao?", "còn tháng này?"
+FOLLOW_UP_CUE = re.compile(r"^(vậy\s+)?còn\b|thì sao|how about|what about")
+
+# chỉ các intent chỉ đọc mới được lặp lại từ context; không bao giờ replay thao tác ghi như phone_config
+FOLLOW_UP_INTENTS = frozenset({
+    "call_report_today",
+    "call_report_week",
+    "call_report_month",
+    "system_status",
+    "phone_list",
+})
+
+# câu hỏi nối tiếp sau một báo cáo cuộc gọi có thể đổi sang kỳ báo cáo khác
+CALL_REPORT_PERIODS = (
+    ("tuần", "call_report_week"),
+    ("tháng", "call_report_month"),
+    ("hôm nay", "call_report_today"),
+    ("hôm qua", "call_report_today"),
+    ("ngày", "call_report_today"),
+)
+
+class IntentMatcher:
+    """bảng pattern đã compile, không thay đổi sau khi tạo"""
+
+    def __init__(self, patterns: Dict[str, List[str]], version: Optional[str] = None):
+        if not isinstance(patterns, dict) or not patterns:
+            raise ValueError("Intent pattern table must be a non-empty object.")
+
+        compiled: List[Tuple[str, List[Pattern]]] = []
+        for intent, intent_patterns in patterns.items():
+            if not isinstance(intent, str) or not intent:
+                raise ValueError(f"Invalid intent name: {intent!r}")
+            if not isinstance(intent_patterns, list) or not intent_patterns:
+                raise ValueError(f"Intent '{intent}' must have a non-empty list of patterns.")
+            regexes = []
+            for pattern in intent_patterns:
+                if not isinstance(pattern, str) or not pattern:
+                    raise ValueError(f"Intent '{intent}' has a non-string or empty pattern: {pattern!r}")
+                try:
+                    regexes.append(re.compile(pattern))
+                except re.error as e:
+                    raise ValueError(f"Intent '{intent}' has an invalid pattern {pattern!r}: {e}")
+            compiled.append((intent, regexes))
+
+        self.patterns = {intent: list(p) for intent, p in patterns.items()}
+        self.version = version or self._compute_version(self.patterns)
+        self._compiled = tuple(compiled)
+
+    @staticmethod
+    def _compute_version(patterns: Dict[str, List[str]]) -> str:
+        """version = hash nội dung bảng pattern"""
+        raw = json.dumps(patterns, ensure_ascii=False, sort_keys=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    @classmethod
+    def from_file(cls, path: str) -> "IntentMatcher":
+        """đọc và compile bảng pattern từ file json"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and "intents" in data:
+            return cls(data["intents"], version=data.get("version"))
+        return cls(data)
+
+    def match(self, text: str) -> str:
+        """trả về intent đầu tiên khớp, theo thứ tự trong bảng"""
+        for intent, regexes in self._compiled:
+            for regex in regexes:
+                if regex.search(text):
+                    return intent
+        return "unknown"
 
 class SimpleIntentAnalyzer:
     """parse intent"""
     
-    def __init__(self):
-        self.intent_patterns = {
-            "call_report_today": [
-                r"báo cáo.*hôm nay",
-                r"số cuộc gọi.*ngày",
-                r"thống kê.*hôm nay",
-                r"cuộc gọi.*today"
-            ],
-            "call_report_week": [
-                r"báo cáo.*tuần",
-                r"thống kê.*tuần",
-                r"cuộc gọi.*tuần",
-                r"weekly.*report"
-            ],
-            "call_report_month": [
-                r"báo cáo.*tháng",
-                r"thống kê.*tháng", 
-                r"cuộc gọi.*tháng",
-                r"monthly.*report"
-            ],
-            "system_status": [
-                r"trạng thái.*hệ thống",
-                r"kiểm tra.*hệ thống",
-                r"hệ thống.*thế nào",
-                r"system.*status",
-                r"health.*check"
-            ],
-            "phone_config": [
-                r"cấu hình.*số",
-                r"config.*phone",
-                r"thiết lập.*điện thoại",
-                r"setup.*number"
-            ],
-            "phone_list": [
-                r"danh sách.*số",
-                r"số điện thoại.*nào",
-                r"list.*phone",
-                r"show.*numbers",
-                r"phone.*list",
-                r"list phone",  # Exact match for "list phone"
-                r"phone.*config.*list"
-            ]
-        }
+    def __init__(self, patterns_file: str, context_store: Optional[ConversationContextStore] = None):
+        """file pattern là nguồn duy nhất; không đọc được thì không khởi động"""
+        self.patterns_file = patterns_file
+        self.context_store = context_store
+
+        try:
+            self._patterns_mtime = os.path.getmtime(patterns_file)
+            self._matcher = IntentMatcher.from_file(patterns_file)
+        except (OSError, ValueError) as e:
+            logger.critical(f"Could not load intent patterns from '{patterns_file}': {e}")
+            raise
+
+        logger.info(f"Intent patterns active, version: {self.pattern_version}")
+
+    @property
+    def intent_patterns(self) -> Dict[str, List[str]]:
+        return self._matcher.patterns
+
+    @property
+    def pattern_version(self) -> str:
+        return self._matcher.version
+
+    def reload_patterns(self) -> bool:
+        """
+        Đọc lại file pattern. Chỉ thay matcher khi toàn bộ pattern hợp lệ,
+        việc thay thế là một phép gán nên request đang chạy vẫn dùng bản cũ.
+        """
+        try:
+            mtime = os.path.getmtime(self.patterns_file)
+        except OSError as e:
+            logger.error(f"Cannot stat intent patterns file '{self.patterns_file}': {e}")
+            return False
+
+        # ghi nhận mtime cả khi file bị từ chối, để mỗi bản lỗi chỉ log một lần
+        self._patterns_mtime = mtime
+        try:
+            matcher = IntentMatcher.from_file(self.patterns_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Rejected intent patterns from '{self.patterns_file}': {e}. Keeping version {self.pattern_version}.")
+            return False
+
+        if matcher.version == self._matcher.version and matcher.patterns == self._matcher.patterns:
+            return False
+
+        old_version = self._matcher.version
+        self._matcher = matcher
+        logger.info(f"Intent patterns reloaded: {old_version} -> {matcher.version}")
+        return True
+
+    async def watch_patterns(self, interval: float = 5.0):
+        """theo dõi mtime của file pattern, compile lại trong thread riêng khi file thay đổi"""
+        logger.info(f"Watching intent patterns file '{self.patterns_file}' every {interval}s")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtime = os.path.getmtime(self.patterns_file)
+                if mtime != self._patterns_mtime:
+                    await asyncio.to_thread(self.reload_patterns)
+            except OSError:
+                continue
+            except Exception as e:
+                # lỗi bất ngờ không được làm dừng watcher
+                logger.error(f"Unexpected error while reloading intent patterns: {e}", exc_info=True)
     
-    def analyze(self, command_text: str) -> Dict[str, Any]:
-        """Phân tích intent từ command text"""
+    def analyze(self, command_text: str, conversation_key: Optional[ConversationKey] = None) -> Dict[str, Any]:
+        """Phân tích intent từ command text, dùng context của cuộc hội thoại cho câu hỏi nối tiếp"""
         command_lower = command_text.lower()
+        # giữ tham chiếu matcher cho cả request
+        matcher = self._matcher
         
         # tìm intent
-        detected_intent = self._detect_intent(command_lower)
+        detected_intent = matcher.match(command_lower)
         
         # lấy paramêtrs
         parameters = self._extract_parameters(command_lower, detected_intent)
+        confidence = 0.95 if detected_intent != "unknown" else 0.1
+        from_context = False
+
+        context = None
+        if self.context_store is not None and conversation_key is not None:
+            context = self.context_store.get(conversation_key)
+
+        if detected_intent == "unknown" and context is not None:
+            follow_up = self._resolve_follow_up(command_lower, parameters, context.intent, context.parameters)
+            if follow_up:
+                detected_intent, parameters = follow_up
+                confidence = 0.7
+                from_context = True
+
+        if detected_intent != "unknown" and self.context_store is not None and conversation_key is not None:
+            self.context_store.put(conversation_key, detected_intent, parameters)
         
         return {
             "intent": detected_intent,
             "parameters": parameters,
-            "confidence": 0.95 if detected_intent != "unknown" else 0.1,
-            "original_text": command_text
+            "confidence": confidence,
+            "original_text": command_text,
+            "pattern_version": matcher.version,
+            "resolved_from_context": from_context
         }
-    
-    def _detect_intent(self, text: str) -> str:
-        """Detect intent từ text"""
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    return intent
-        return "unknown"
+
+    def _resolve_follow_up(self, text: str, parameters: Dict[str, Any], last_intent: str, last_parameters: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """ghép câu hỏi nối tiếp (vd. "tuần trước thì sao?") với intent chỉ đọc trước đó"""
+        if last_intent not in FOLLOW_UP_INTENTS:
+            return None
+        has_cue = FOLLOW_UP_CUE.search(text) is not None
+
+        if not last_intent.startswith("call_report_"):
+            return (last_intent, dict(last_parameters)) if has_cue else None
+
+        # với báo cáo, câu nối tiếp phải nêu kỳ báo cáo; chỉ có "thì sao" thì không đủ
+        period = parameters.get("period")
+        names_period = any(keyword in text for keyword, _ in CALL_REPORT_PERIODS)
+        if not names_period and period is None:
+            return None
+        if not has_cue and period is None:
+            return None
+
+        intent = last_intent
+        for keyword, period_intent in CALL_REPORT_PERIODS:
+            if keyword in text:
+                intent = period_intent
+                break
+
+        # chỉ dùng kỳ trong câu hiện tại, không mang "period" cũ sang ("còn tuần này?" sau "tuần trước")
+        return intent, ({"period": period} if period else {})
     
     def _extract_parameters(self, text: str, intent: str) -> Dict[str, Any]:
         """trích xuất parameters từ text"""
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+class BulkheadFull(Exception):
+    """bulkhead đã đủ số request đang chạy và hàng đợi cũng đã đầy"""
+
+    def __init__(self, name: str, message: Optional[str] = None):
+        super().__init__(message or f"Bulkhead '{name}' is full")
+        self.name = name
+
+class BulkheadTimeout(BulkheadFull):
+    """request bị bỏ khỏi hàng đợi vì đã hết deadline trước khi có slot"""
+
+    def __init__(self, name: str):
+        super().__init__(name, f"Deadline passed while queued in bulkhead '{name}'")
+
+class Bulkhead:
+    """
+    Giới hạn số request chạy đồng thời và độ dài hàng đợi cho một intent.
+    Không có ưu tiên giữa các bulkhead: "ưu tiên" intent rẻ chỉ thể hiện qua
+    việc cấu hình limit rộng hơn cho chúng.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int):
+        if max_concurrent < 1 or max_queue < 0:
+            raise ValueError(f"Invalid bulkhead limits for '{name}': max_concurrent={max_concurrent}, max_queue={max_queue}")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Lấy một slot, trả về thời gian đã chờ (giây). Raise BulkheadFull ngay nếu
+        hàng đợi đầy, hoặc BulkheadTimeout nếu chờ quá `timeout`.
+        Người gọi phải gọi release() khi xong.
+        """
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise BulkheadFull(self.name)
+            if timeout is not None and timeout <= 0:
+                self.expired += 1
+                raise BulkheadTimeout(self.name)
+
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            if self._semaphore.locked():
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=timeout)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.expired += 1
+            raise BulkheadTimeout(self.name)
+        finally:
+            self.waiting -= 1
+
+        wait = time.monotonic() - started
+        self.accepted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.in_flight += 1
+        return wait
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "expired_in_queue": self.expired,
+            "avg_queue_wait_ms": round(self.total_wait / self.accepted * 1000, 3) if self.accepted else 0.0,
+            "max_queue_wait_ms": round(self.max_wait * 1000, 3),
+        }
\ No newline at end of file
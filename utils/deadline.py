@@ -0,0 +1,42 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Optional
+
+class DeadlineExceeded(Exception):
+    """hết ngân sách thời gian ở một stage; `pending` là task vẫn đang chạy"""
+
+    def __init__(self, stage: str, pending: Optional["asyncio.Future"] = None):
+        super().__init__(f"Deadline exceeded during stage '{stage}'")
+        self.stage = stage
+        self.pending = pending
+
+class Deadline:
+    """ngân sách thời gian end-to-end cho một webhook request"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    async def run(self, aw: Awaitable[Any], stage: str) -> Any:
+        """
+        Chờ `aw` trong thời gian còn lại. Khi hết hạn, task không bị huỷ mà
+        được trả về trong DeadlineExceeded để caller chạy tiếp ở background.
+        """
+        task = asyncio.ensure_future(aw)
+        remaining = self.remaining()
+        if remaining <= 0 and not task.done():
+            raise DeadlineExceeded(stage, task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=remaining)
+        except asyncio.TimeoutError:
+            if task.done():
+                # task xong đúng lúc hết hạn: trả kết quả (hoặc raise lỗi của chính task)
+                return task.result()
+            raise DeadlineExceeded(stage, task)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import json
+from typing import Any, Callable
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn, fallback về json của stdlib
+    orjson = None
+
+def _stdlib_dumps(content: Any) -> bytes:
+    """encode bằng json của stdlib với đúng cấu hình JSONResponse của starlette"""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode json giống JSONResponse của starlette, dùng orjson nếu có.
+
+    Giới hạn khi dùng orjson: NaN/inf được ghi thành null (stdlib raise
+    ValueError), và ở một số phiên bản orjson float lớn có dạng khác
+    (1e20 thay vì 1e+20). Payload của webhook hiện không có các giá trị này;
+    benchmarks/bench_responses.py báo nếu có khác biệt.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            # vd. số nguyên vượt 64 bit, để stdlib xử lý như trước
+            pass
+    return _stdlib_dumps(content)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse dùng encoder nhanh cho các response động"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def prebuilt_json_response(status_code: int, content: Any) -> Callable[[], Response]:
+    """
+    Serialize một response cố định đúng một lần. Mỗi lần gọi chỉ tạo Response
+    mới (header là của từng request) từ body bytes đã có sẵn.
+    """
+    body = _stdlib_dumps(content)
+
+    def build() -> Response:
+        return Response(content=body, status_code=status_code, media_type="application/json")
+
+    return build
\ No newline at end of file
@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+class ProfileSession:
+    """một phiên lấy mẫu, giữ riêng bộ đếm stack của nó"""
+
+    def __init__(self, thread: threading.Thread, samples: Counter):
+        self.thread = thread
+        self.samples = samples
+
+    def join(self):
+        self.thread.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu stack của một thread (mặc định là thread chạy event loop)
+    bằng sys._current_frames(), kết quả ở dạng collapsed stack
+    (mở được bằng speedscope hoặc flamegraph.pl).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        stack: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _sample(self, thread_id: int, duration: float, samples: Counter):
+        ends_at = time.monotonic() + duration
+        while time.monotonic() < ends_at:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                samples[self._collapse(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+
+    def start(self, thread_id: int, duration: float) -> ProfileSession:
+        """chạy sampler trong thread riêng; raise RuntimeError nếu đang có phiên khác"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profiling session is already running.")
+        samples: Counter = Counter()
+
+        def run():
+            try:
+                self._sample(thread_id, duration, samples)
+            finally:
+                self._lock.release()
+
+        thread = threading.Thread(target=run, name="sampling-profiler", daemon=True)
+        thread.start()
+        return ProfileSession(thread, samples)
+
+_NULL_STAGE = nullcontext()
+
+class RequestTrace:
+    """ghi lại thời gian của từng stage trong một request"""
+
+    __slots__ = ("name", "started_at", "_start", "stages")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.stages: List[tuple] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+class NullTrace:
+    """trace rỗng khi tracer bị tắt, không đo gì cả"""
+
+    __slots__ = ()
+
+    def stage(self, name: str):
+        return _NULL_STAGE
+
+NULL_TRACE = NullTrace()
+
+class SlowRequestTracer:
+    """lưu breakdown theo stage của các request chậm hơn ngưỡng vào ring buffer"""
+
+    def __init__(self, threshold_ms: float = 0, capacity: int = 100):
+        self.threshold = threshold_ms / 1000
+        self.enabled = threshold_ms > 0
+        self.records: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+
+    def begin(self, name: str):
+        return RequestTrace(name) if self.enabled else NULL_TRACE
+
+    def finish(self, trace) -> Optional[Dict[str, Any]]:
+        """ghi lại trace nếu request chậm hơn ngưỡng"""
+        if trace is NULL_TRACE:
+            return None
+        elapsed = trace.elapsed()
+        if elapsed < self.threshold:
+            return None
+        record = {
+            "name": trace.name,
+            "started_at": trace.started_at.isoformat(),
+            "total_ms": round(elapsed * 1000, 3),
+            "stages": [{"stage": name, "ms": round(duration * 1000, 3)} for name, duration in trace.stages],
+        }
+        self.records.append(record)
+        return record
\ No newline at end of file
@@ -5,9 +5,10 @@ class ResponseFormatter:
     
     @staticmethod
     def format_call_report(data: Dict[str, Any], period: str = "today") -> str:
-        """Format báo cáo cuộc gọi"""
-        if period == "today":
-            return f"""📞 **BÁO CÁO CUỘC GỌI HÔM NAY**
+        """Format báo cáo cuộc gọi, hỗ trợ cả kỳ trước (yesterday, last_week, last_month)"""
+        if period in ("today", "yesterday"):
+            day_label = "HÔM NAY" if period == "today" else "HÔM QUA"
+            return f"""📞 **BÁO CÁO CUỘC GỌI {day_label}**
             
 🔢 Tổng cuộc gọi: {data['total_calls']}
 ✅ Thành công: {data['successful_calls']}
@@ -16,10 +17,11 @@ class ResponseFormatter:
 
 _Cập nhật lúc: {datetime.now().strftime('%H:%M %d/%m/%Y')}_"""
         
-        elif period == "week":
+        elif period in ("week", "last_week"):
             daily_str = "\n".join([f"  • {day['date']}: {day['calls']} cuộc gọi" 
                                   for day in data['daily_breakdown']])
-            return f"""📊 **BÁO CÁO TUẦN**
+            week_label = "TUẦN" if period == "week" else "TUẦN TRƯỚC"
+            return f"""📊 **BÁO CÁO {week_label}**
             
 🔢 Tổng cuộc gọi: {data['total_calls']}
 ✅ Thành công: {data['successful_calls']}
@@ -30,8 +32,9 @@ _Cập nhật lúc: {datetime.now().strftime('%H:%M %d/%m/%Y')}_"""
 
 _Cập nhật lúc: {datetime.now().strftime('%H:%M %d/%m/%Y')}_"""
         
-        elif period == "month":
-            return f"""📈 **BÁO CÁO THÁNG**
+        elif period in ("month", "last_month"):
+            month_label = "THÁNG" if period == "month" else "THÁNG TRƯỚC"
+            return f"""📈 **BÁO CÁO {month_label}**
             
 🔢 Tổng cuộc gọi: {data['total_calls']}
 📊 Tăng trưởng: {data['growth_rate']}
@@ -112,4 +115,18 @@ Vui lòng thử lại sau! 🔄"""
 • `show numbers` - Danh sách số điện thoại
 • `cấu hình số [SDT]` - Cấu hình số mới
 
-💡 Hãy thử lại với một trong các lệnh trên!"""
\ No newline at end of file
+💡 Hãy thử lại với một trong các lệnh trên!"""
+    
+    @staticmethod
+    def format_processing() -> str:
+        """Format cho yêu cầu đang được xử lý ở background"""
+        return """⏳ **ĐANG XỬ LÝ**
+
+Yêu cầu của bạn đang được xử lý, kết quả sẽ được gửi lại ngay khi sẵn sàng! 🙏"""
+    
+    @staticmethod
+    def format_busy() -> str:
+        """Format khi hệ thống đang quá tải cho loại lệnh này"""
+        return """🚦 **HỆ THỐNG ĐANG BẬN**
+
+Hiện có quá nhiều yêu cầu cùng loại, vui lòng thử lại sau ít phút! 🔄"""
\ No newline at end of file